@@ -0,0 +1,129 @@
+import streamlit as st
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+import os
+import orjson
+import time
+import hashlib
+import tempfile
+
+# Load environment variables
+load_dotenv()
+API_KEY = os.getenv("API_KEY")
+
+# On-disk cache for eBird responses so restarts don't re-fetch
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ebird_cache")
+# eBird "recent" observations are stable for about 15 minutes; shared by the disk and in-memory caches
+CACHE_TTL = 900
+
+
+# Shared HTTP session so repeated eBird calls reuse pooled keep-alive connections across reruns
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    session.headers.update({'X-eBirdApiToken': API_KEY})
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                          max_retries=Retry(total=3, backoff_factor=0.3)))
+    return session
+
+
+# Cache file for a request, keyed on the URL, params and a hash of the API key
+def cache_path(url, params=None):
+    key = f"{url}|{sorted((params or {}).items())}|{hashlib.sha256(str(API_KEY).encode()).hexdigest()}"
+    return os.path.join(CACHE_DIR, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+
+# Write a cache entry to a temp file and swap it in, so readers never see a partial file.
+# The disk cache is only an optimization, so a failed write is skipped rather than raised.
+def write_entry(path, entry):
+    tmp_path = None
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as cache_file:
+            cache_file.write(orjson.dumps(entry))
+        os.replace(tmp_path, path)
+    except OSError:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+# Fetch a URL through the disk cache, revalidating stale entries with ETag/Last-Modified
+def cached_get(url, params=None):
+    path = cache_path(url, params)
+    entry = None
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as cache_file:
+                entry = orjson.loads(cache_file.read())
+        except (OSError, ValueError):
+            entry = None
+
+    if entry is not None and time.time() - entry["fetched"] < CACHE_TTL:
+        return 200, entry["data"]
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    try:
+        response = get_session().get(url, headers=headers, params=params, timeout=10)
+    except requests.RequestException:
+        # Serve the stale copy while the API is unreachable
+        if entry is not None:
+            return 200, entry["data"]
+        raise
+
+    if response.status_code == 304 and entry is not None:
+        data = entry["data"]
+    elif response.status_code == 200:
+        data = orjson.loads(response.content)
+    else:
+        return response.status_code, None
+
+    # A 304 may omit the validators, so fall back to the stored ones
+    previous = entry or {}
+    write_entry(path, {"fetched": time.time(),
+                       "etag": response.headers.get("ETag", previous.get("etag")),
+                       "last_modified": response.headers.get("Last-Modified", previous.get("last_modified")),
+                       "data": data})
+    return 200, data
+
+
+# Raised when an eBird request fails; the message is meant for st.error
+class EBirdError(Exception):
+    pass
+
+
+# Fetch an eBird endpoint, raising EBirdError on failure so st.cache_data only memoizes real payloads
+def fetch_json(url, params=None):
+    try:
+        status_code, data = cached_get(url, params=params)
+    except ValueError as exc:
+        raise EBirdError("Error decoding API response.") from exc
+    except requests.RequestException as exc:
+        raise EBirdError("Error reaching the eBird API.") from exc
+    if status_code != 200:
+        raise EBirdError(f"Error: Received status code {status_code}")
+    return data
+
+
+# Remove every stored response so the next fetch goes to the network
+def clear_disk_cache():
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        # Another session may have removed or replaced the file already
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+        except OSError:
+            pass
@@ -2,14 +2,9 @@ import streamlit as st
 from datetime import date
 import pandas as pd
 import matplotlib.pyplot as plt
-import requests
-from dotenv import load_dotenv
-import os
 import pydeck as pdk
-
-# Load environment variables
-load_dotenv()
-API_KEY = os.getenv("API_KEY")
+import time
+from ebird_api import CACHE_TTL, EBirdError, clear_disk_cache, fetch_json
 
 # Inject custom styles
 st.markdown(
@@ -39,26 +34,60 @@ st.markdown(
 )
 
 
-# Fetch data function
+# Above this many sightings the map switches from individual points to hexagon bins
+HEXAGON_THRESHOLD = 500
+
+# Rows shown in the table before the user asks for all of them
+TABLE_PREVIEW_ROWS = 500
+
+# Typed column formatting applied in the browser
+TABLE_COLUMN_CONFIG = {
+    "obsDt": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm"),
+    "howMany": st.column_config.NumberColumn(format="%d"),
+    "lat": st.column_config.NumberColumn(format="%.5f"),
+    "lng": st.column_config.NumberColumn(format="%.5f"),
+}
+
+
+# Fetch data function; failures raise EBirdError, which st.cache_data does not cache
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
 def observed_US():
-    url = "https://api.ebird.org/v2/data/obs/US/recent"
-    response = requests.get(url, headers={'X-eBirdApiToken': API_KEY})
-    if response.status_code == 200:
-        try:
-            return response.json()
-        except ValueError:
-            st.error("Error decoding API response.")
-            return []
-    else:
-        st.error(f"Error: Received status code {response.status_code}")
-        return []
+    # The table and CSV export show every field, so the records are kept whole
+    data = fetch_json("https://api.ebird.org/v2/data/obs/US/recent")
+    # Identifies this fetch, so caches derived from it never serve an older one
+    return data, time.time_ns()
+
+
+# Encode the filtered table as CSV, cached on the data version and filter state rather than the DataFrame contents
+@st.cache_data(ttl=CACHE_TTL, max_entries=20)
+def convert_to_csv(df_hash_key, _dataframe):
+    return _dataframe.to_csv(index=False).encode('utf-8')
+
 
+# Refresh cached API data on demand
+if st.sidebar.button("Refresh Data"):
+    st.cache_data.clear()
+    clear_disk_cache()
 
 # Fetch bird observation data
-species_dict = observed_US()
-species_list = [i["comName"] for i in species_dict]
+try:
+    species_dict, data_version = observed_US()
+except EBirdError as exc:
+    st.error(str(exc))
+    species_dict, data_version = [], None
+species_list = list(dict.fromkeys(i["comName"] for i in species_dict))  # Remove duplicates, keep order
 species_list.insert(0, "")
 
+# Build the observation DataFrame once and index it by species
+df_all = pd.DataFrame(species_dict)
+if not df_all.empty:
+    # Counts stay nullable so uncounted sightings aren't mistaken for zero birds
+    if "howMany" in df_all:
+        df_all["howMany"] = pd.to_numeric(df_all["howMany"], errors="coerce").astype("Int32")
+    # Parse observation dates once; ISO8601 covers both "YYYY-MM-DD HH:MM" and date-only values
+    df_all["obsDt"] = pd.to_datetime(df_all["obsDt"], format="ISO8601", cache=True, errors="coerce")
+groups = dict(tuple(df_all.groupby("comName"))) if not df_all.empty else {}
+
 # App layout
 st.title("Bird Observation Dashboard")
 st.sidebar.header("Filters and Options")
@@ -101,30 +130,43 @@ with maps:
             st.info(f"Displaying map for {species_selected}")
 
             # Filter data for the selected species
-            species_data = [obs for obs in species_dict if obs["comName"] == species_selected]
-            locations = [{"lat": obs["lat"], "lon": obs["lng"]} for obs in species_data if
-                         "lat" in obs and "lng" in obs]
-
-            if locations:
-                # Create a DataFrame for map points
-                df_locations = pd.DataFrame(locations)
-
-                # Define a pydeck layer
-                layer = pdk.Layer(
-                    "ScatterplotLayer",
-                    data=df_locations,
-                    get_position="[lon, lat]",
-                    get_radius=5000,
-                    get_color=[200, 30, 0, 160],
-                    pickable=True,
-                )
+            species_data = groups.get(species_selected, pd.DataFrame(columns=["lat", "lng"]))
+            df_locations = (species_data[["lat", "lng"]].dropna()
+                            .rename(columns={"lng": "lon"}).reset_index(drop=True))
+
+            if not df_locations.empty:
+                # Send [lon, lat] pairs as plain arrays to keep the deck.gl payload compact
+                positions = df_locations[["lon", "lat"]].round(5)
+                dense = len(df_locations) > HEXAGON_THRESHOLD
+
+                # Define a pydeck layer; dense sightings are binned into hexagons on the GPU
+                if dense:
+                    layer = pdk.Layer(
+                        "HexagonLayer",
+                        data=positions.to_numpy().tolist(),
+                        get_position="-",
+                        radius=10000,
+                        elevation_scale=50,
+                        extruded=True,
+                        pickable=True,
+                        coverage=0.8,
+                    )
+                else:
+                    layer = pdk.Layer(
+                        "ScatterplotLayer",
+                        data=positions.drop_duplicates().to_numpy().tolist(),
+                        get_position="-",
+                        get_radius=5000,
+                        get_color=[200, 30, 0, 160],
+                        pickable=True,
+                    )
 
                 # Viewport settings
                 view_state = pdk.ViewState(
-                    latitude=df_locations["lat"].mean(),
-                    longitude=df_locations["lon"].mean(),
+                    latitude=float(df_locations["lat"].mean()),
+                    longitude=float(df_locations["lon"].mean()),
                     zoom=6,
-                    pitch=0,
+                    pitch=40 if dense else 0,
                 )
 
                 # Render the map with open-street-map style
@@ -144,15 +186,13 @@ with maps:
 with line_plot:
     species_selected_for_plot = st.selectbox("Select species for line plot", options=species_list)
     if species_selected_for_plot:
-        selected_species_for_plot = next(
-            (species for species in species_dict if species["comName"] == species_selected_for_plot), None)
-        if selected_species_for_plot:
-            dates = [obs["obsDt"] for obs in species_dict if obs["comName"] == species_selected_for_plot]
-            populations = [obs["howMany"] for obs in species_dict if obs["comName"] == species_selected_for_plot]
-
-            if dates and populations:
+        selected_species_for_plot = groups.get(species_selected_for_plot)
+        if selected_species_for_plot is not None:
+            if "howMany" in selected_species_for_plot:
                 # Convert date to a more readable format
-                dates = pd.to_datetime(dates).dt.strftime('%Y-%m-%d')
+                dates = selected_species_for_plot["obsDt"].dt.strftime('%Y-%m-%d')
+                # Uncounted sightings are drawn as 0
+                populations = selected_species_for_plot["howMany"].fillna(0).astype("int32")
 
                 fig, ax = plt.subplots()
                 ax.plot(dates, populations, marker='o')
@@ -169,15 +209,13 @@ with line_plot:
 with bar_graph:
     species_selected_for_bar = st.selectbox("Select species for bar graph", options=species_list)
     if species_selected_for_bar:
-        selected_species_for_bar = next(
-            (species for species in species_dict if species["comName"] == species_selected_for_bar), None)
-        if selected_species_for_bar:
-            dates = [obs["obsDt"] for obs in species_dict if obs["comName"] == species_selected_for_bar]
-            populations = [obs["howMany"] for obs in species_dict if obs["comName"] == species_selected_for_bar]
-
-            if dates and populations:
+        selected_species_for_bar = groups.get(species_selected_for_bar)
+        if selected_species_for_bar is not None:
+            if "howMany" in selected_species_for_bar:
                 # Convert date to a more readable format
-                dates = pd.to_datetime(dates).dt.strftime('%Y-%m-%d')
+                dates = selected_species_for_bar["obsDt"].dt.strftime('%Y-%m-%d')
+                # Uncounted sightings are drawn as 0
+                populations = selected_species_for_bar["howMany"].fillna(0).astype("int32")
 
                 fig, ax = plt.subplots()
                 ax.bar(dates, populations)
@@ -194,19 +232,24 @@ with bar_graph:
 with table:
     st.subheader("Interactive Bird Observations Table")
 
-    # Convert the species dictionary into a DataFrame
-    df = pd.DataFrame(species_dict)
+    # Reuse the observation DataFrame, whose dates are already parsed
+    df = df_all
 
     if not df.empty:
         # Allow filtering by species
+        species_options = df["comName"].unique()
         species_filter = st.multiselect(
-            "Filter by species:", options=df["comName"].unique(), default=df["comName"].unique()
+            "Filter by species:", options=species_options, default=species_options
         )
-        filtered_df = df[df["comName"].isin(species_filter)]
+        # Skip the boolean-mask copy when every species is still selected
+        if len(species_filter) == len(species_options):
+            filtered_df = df
+        else:
+            filtered_df = df[df["comName"].isin(species_filter)]
 
         # Allow filtering by observation date
-        min_date = pd.to_datetime(df["obsDt"].min())
-        max_date = pd.to_datetime(df["obsDt"].max())
+        min_date = df["obsDt"].min()
+        max_date = df["obsDt"].max()
         date_range = st.date_input(
             "Filter by date range:",
             [min_date, max_date],
@@ -217,21 +260,23 @@ with table:
         if len(date_range) == 2:
             start_date, end_date = date_range
             filtered_df = filtered_df[
-                (pd.to_datetime(filtered_df["obsDt"]) >= start_date) &
-                (pd.to_datetime(filtered_df["obsDt"]) <= end_date)
+                (filtered_df["obsDt"] >= pd.Timestamp(start_date)) &
+                (filtered_df["obsDt"] < pd.Timestamp(end_date) + pd.Timedelta(days=1))
                 ]
 
-        # Display the filtered data
-        st.dataframe(filtered_df)
-
+        # Display the filtered data, sending only a preview unless all rows are requested
+        show_all = True
+        if len(filtered_df) > TABLE_PREVIEW_ROWS:
+            show_all = st.checkbox(f"Show all {len(filtered_df)} rows")
+        st.dataframe(
+            filtered_df if show_all else filtered_df.head(TABLE_PREVIEW_ROWS),
+            width="stretch",
+            height=400,
+            column_config=TABLE_COLUMN_CONFIG,
+        )
 
         # Allow user to download the table
-        @st.cache_data
-        def convert_to_csv(dataframe):
-            return dataframe.to_csv(index=False).encode('utf-8')
-
-
-        csv = convert_to_csv(filtered_df)
+        csv = convert_to_csv((data_version, tuple(species_filter), tuple(date_range)), filtered_df)
         st.download_button(
             label="Download Table as CSV",
             data=csv,
@@ -1,38 +1,92 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
-import matplotlib.pyplot as plt
+import pydeck as pdk
 from datetime import datetime
-import requests
-from dotenv import load_dotenv
-import os
+from collections import defaultdict
 import matplotlib
+import time
+import math
+from ebird_api import CACHE_TTL, EBirdError, clear_disk_cache, fetch_json
 
 # Group 11
 # CAP 4104 UHA 1248
 # December 6, 2024
 
-# Load environment variables
-load_dotenv()
-API_KEY = os.getenv("API_KEY")
-
-
-@st.cache_data
+# Above this many points the map defaults to hexagon bins and also offers pins or a heatmap
+AGGREGATION_THRESHOLD = 5000
+
+# On-screen radius of a hexagon bin
+HEXAGON_RADIUS_PIXELS = 20
+
+# Rows shown in a table before the user asks for all of them
+TABLE_PREVIEW_ROWS = 500
+
+# Display names for the interactive table columns, keyed on the eBird record field names
+TABLE_COLUMN_MAPPING = {
+    "speciesCode": "Species Code",
+    "comName": "Common Name",
+    "sciName": "Scientific Name",
+    "locId": "Location ID",
+    "locName": "Location Observed",
+    "obsDt": "Date Observed",
+    "howMany": "Population",
+    "lat": "Latitude",
+    "lng": "Longitude",
+    "obsValid": "Valid Observation",
+    "obsReviewed": "Reviewed Observation",
+    "locationPrivate": "Location Private",
+    "subId": "Sub ID",
+}
+
+# Columns kept when the table is simplified
+SIMPLIFIED_TABLE_COLUMNS = ["comName", "sciName", "locName", "howMany", "lat", "lng"]
+
+# Typed column formatting applied in the browser, under both raw and display names
+TABLE_COLUMN_CONFIG = {
+    "obsDt": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm"),
+    "Date Observed": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm"),
+    "howMany": st.column_config.NumberColumn(format="%d"),
+    "Population": st.column_config.NumberColumn(format="%d"),
+    "lat": st.column_config.NumberColumn(format="%.5f"),
+    "Latitude": st.column_config.NumberColumn(format="%.5f"),
+    "lng": st.column_config.NumberColumn(format="%.5f"),
+    "Longitude": st.column_config.NumberColumn(format="%.5f"),
+}
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
 def observed_US_cached():
-    url = "https://api.ebird.org/v2/data/obs/US/recent"
-    response = requests.get(url, headers={'X-eBirdApiToken': API_KEY})
-    if response.status_code == 200:
-        try:
-            return response.json()
-        except ValueError:
-            st.error("Error decoding API response.")
-            return []
-    else:
-        st.error(f"Error: Received status code {response.status_code}")
-        return []
-
-
-# Fetch recent notable observations in a region
+    # Failures raise EBirdError, which st.cache_data does not cache
+    data = fetch_json("https://api.ebird.org/v2/data/obs/US/recent")
+    # Sorted unique species names, built once per fetch for the sidebar
+    species_names = sorted(dict.fromkeys(obs["comName"] for obs in data))
+
+    # Build the columnar observation frame once so every view filters the same cached copy;
+    # the Raw Data and full table views show every field, so the records are kept whole
+    df = pd.DataFrame(data)
+    species_groups = {}
+    if not df.empty:
+        df["comName"] = df["comName"].astype("category")
+        # Counts stay nullable so uncounted sightings aren't mistaken for zero birds
+        how_many = df["howMany"] if "howMany" in df else pd.Series(np.nan, index=df.index)
+        df["howMany"] = pd.to_numeric(how_many, errors="coerce").astype("Int32")
+        # Parse observation dates once; ISO8601 covers both "YYYY-MM-DD HH:MM" and date-only values
+        df["obsDt"] = pd.to_datetime(df["obsDt"], format="ISO8601", cache=True, errors="coerce")
+        # Row positions of each species, so views can gather a selection directly
+        species_groups = df.groupby("comName", observed=True, sort=False).indices
+    # Identifies this build of the frame; derived caches key on it so they never outlive the data
+    data_version = time.time_ns()
+    return df, species_groups, species_names, data_version
+
+
+# Notable observation fields shown in the Notable Observations tab
+NOTABLE_FIELDS = ("speciesCode", "comName", "locName", "obsDt", "howMany", "lat", "lng")
+
+
+# Fetch recent notable observations in a region; failures raise EBirdError and are not cached
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
 def fetch_notable_observations(region_code, back=14, detail="simple", hotspot=False, max_results=100):
     url = f"https://api.ebird.org/v2/data/obs/{region_code}/recent/notable"
     params = {
@@ -42,46 +96,77 @@ def fetch_notable_observations(region_code, back=14, detail="simple", hotspot=Fa
         "maxResults": max_results,
         "sppLocale": "en"  # Default language for species names
     }
-    response = requests.get(url, headers={'X-eBirdApiToken': API_KEY}, params=params)
+    data = fetch_json(url, params=params)
+    return [{k: obs[k] for k in NOTABLE_FIELDS if k in obs} for obs in data]
+
+# Group observations by species name in a single pass
+def group_by_species(species_data):
+    by_name = defaultdict(list)
+    for obs in species_data.to_dict("records"):
+        by_name[obs["comName"]].append(obs)
+    return by_name
+
+
+# Display a table preview; the full frame is only sent to the browser on request
+def display_dataframe(df, key):
+    show_all = True
+    if len(df) > TABLE_PREVIEW_ROWS:
+        show_all = st.checkbox(f"Show all {len(df)} rows", key=key)
+    st.dataframe(
+        df if show_all else df.head(TABLE_PREVIEW_ROWS),
+        width="stretch",
+        height=400,
+        column_config=TABLE_COLUMN_CONFIG,
+    )
 
-    if response.status_code == 200:
-        try:
-            return response.json()
-        except ValueError:
-            st.error("Error decoding API response.")
-            return []
-    else:
-        st.error(f"Error: Received status code {response.status_code}")
-        return []
 
 def info_selected_obs(selected_obs):
-    # Accessing 'howMany' safely using .get() to avoid KeyError
-    population = selected_obs.get("howMany", "Data not available")
+    population = selected_obs["howMany"]
+    if pd.isna(population):
+        population = "Data not available"
 
     # Display information about the observation
     st.markdown(f"**Species Name:** {selected_obs['comName']}")
     st.markdown(f"**Location:** {selected_obs['locName']}")
-    st.markdown(f"**Latitude:** {selected_obs['lat']}")
-    st.markdown(f"**Longitude:** {selected_obs['lng']}")
+    st.markdown(f"**Latitude:** {selected_obs['lat']:.5f}")
+    st.markdown(f"**Longitude:** {selected_obs['lng']:.5f}")
     st.markdown(f"**Observation Date:** {selected_obs['obsDt']}")
     st.markdown(f"**Population:** {population} birds observed")
 
-def display_map(species_selected, pin_color="red"):
-    species_dict = observed_US_cached()
-    species_data = [obs for obs in species_dict if obs["comName"] in species_selected]
-
-    if not species_data:
+# Observations for a species selection, memoized on the sorted species tuple and data version
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def species_frame(species_tuple, data_version, _df_all, _species_groups):
+    # Gather the selected species' rows by position instead of scanning every comName
+    positions = [_species_groups[species] for species in species_tuple if species in _species_groups]
+    if not positions:
+        return _df_all.iloc[0:0]
+    species_data = _df_all.iloc[np.sort(np.concatenate(positions))].reset_index(drop=True)
+    species_data["comName"] = species_data["comName"].cat.remove_unused_categories()
+    return species_data
+
+
+# Map locations for a species selection, memoized on the sorted species tuple and data version
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def locations_for(species_tuple, data_version, _df_all, _species_groups):
+    species_data = species_frame(species_tuple, data_version, _df_all, _species_groups)
+    locations = species_data.dropna(subset=["lat", "lng"]).rename(
+        columns={"lat": "latitude", "lng": "longitude", "locName": "city", "comName": "species"})
+    locations = locations[["species", "city", "latitude", "longitude"]]
+    # Round the copy sent to deck.gl to about 1 m to keep the JSON payload and tooltips short
+    return locations.round({"latitude": 5, "longitude": 5})
+
+
+def display_map(data_version, df_all, species_groups, species_selected, pin_color="red"):
+    species_data = species_frame(tuple(sorted(species_selected)), data_version, df_all, species_groups)
+
+    if species_data.empty:
         st.error(f"No data available for species: {', '.join(species_selected)}")
         return
 
-    # Create a list of locations with species names, latitudes, longitudes, and cities
-    locations = [{"latitude": obs["lat"], "longitude": obs["lng"], "city": obs["locName"], "species": obs["comName"],
-                  "population": obs.get("howMany", "N/A")}
-                 for obs in species_data if "lat" in obs and "lng" in obs]
-
-    if locations:
-        df = pd.DataFrame(locations)
+    # Create a DataFrame of locations with species names, latitudes, longitudes, and cities
+    df = locations_for(tuple(sorted(species_selected)), data_version, df_all, species_groups)
 
+    if not df.empty:
         # Check if the map center is saved in session state, otherwise calculate the average center
         if "map_center" not in st.session_state:
             center_lat = df["latitude"].mean()
@@ -118,38 +203,66 @@ def display_map(species_selected, pin_color="red"):
         # Save the map center position
         st.session_state.map_center = (center_lat, center_lon)
 
-        # Create the map with individual pins for each species
-        fig = px.scatter_mapbox(df, lat='latitude', lon='longitude', zoom=zoom_level,
-                                mapbox_style="open-street-map", opacity=0.7)
-
-        # Update the hovertemplate and marker color for the same color for all pins
-        fig.update_traces(
-            marker=dict(
-                size=pin_size,  # Use the pin_size argument here
-                color=pin_color,  # Use the pin_color argument here
-                opacity=0.6
-            ),
-            hovertemplate='<b>Species: %{text}</b><br>Location: %{hovertext}<br>Latitude: %{lat}<br>Longitude: %{lon}<extra></extra>',
-            text=df['species'],  # Species name for the hover text
-            hovertext=df['city']  # Location (city) for the hovertext
-        )
-
-        # Update map layout to make the map interactive
-        fig.update_layout(
-            margin={"r": 0, "t": 0, "l": 0, "b": 0},
-            mapbox_center={"lat": center_lat, "lon": center_lon},
-            mapbox=dict(
-                style="open-street-map",
+        # Convert the picked pin color into an RGBA fill for deck.gl
+        fill_color = [int(round(c * 255)) for c in matplotlib.colors.to_rgb(pin_color)] + [150]
+
+        # Very large selections can be aggregated on the GPU instead of drawing every pin
+        map_layer = "Pins"
+        if len(df) > AGGREGATION_THRESHOLD:
+            map_layer = st.radio("Map layer", ["Hexagons", "Pins", "Heatmap"], horizontal=True)
+
+        tooltip = None
+        if map_layer == "Hexagons":
+            # Bin radius of about HEXAGON_RADIUS_PIXELS on screen at the chosen zoom, in Web Mercator metres
+            metres_per_pixel = 156543.03392 * math.cos(math.radians(float(center_lat))) / 2 ** zoom_level
+            hex_radius = HEXAGON_RADIUS_PIXELS * metres_per_pixel
+            layer = pdk.Layer(
+                "HexagonLayer",
+                data=df[["longitude", "latitude"]],
+                get_position=["longitude", "latitude"],
+                radius=hex_radius,
+                # Keep column heights in proportion to the bin size
+                elevation_scale=hex_radius / 200,
+                extruded=True,
+                pickable=True,
+                coverage=0.8,
+            )
+        elif map_layer == "Heatmap":
+            layer = pdk.Layer(
+                "HeatmapLayer",
+                data=df[["longitude", "latitude"]],
+                get_position=["longitude", "latitude"],
+            )
+        else:
+            # Create the map with individual pins for each species, drawn on the GPU by deck.gl
+            layer = pdk.Layer(
+                "ScatterplotLayer",
+                data=df,
+                get_position=["longitude", "latitude"],
+                # Pin size is in screen pixels so pins stay visible at every zoom level
+                get_radius=pin_size,
+                # Quoted so pydeck sends a literal string rather than an accessor expression
+                radius_units='"pixels"',
+                get_fill_color=fill_color,
+                pickable=True,
+            )
+            tooltip = {"html": "<b>Species: {species}</b><br>Location: {city}<br>"
+                               "Latitude: {latitude}<br>Longitude: {longitude}"}
+
+        deck = pdk.Deck(
+            layers=[layer],
+            initial_view_state=pdk.ViewState(
+                latitude=float(center_lat),
+                longitude=float(center_lon),
                 zoom=zoom_level,
-                bearing=0,
-                pitch=0
+                pitch=40 if map_layer == "Hexagons" else 0,
             ),
-            dragmode="zoom",  # Enable dragging and zooming
-            hovermode="closest",  # Highlight the closest point when hovering
+            map_style="light",
+            tooltip=tooltip,
         )
 
         # Display the map
-        st.plotly_chart(fig)
+        st.pydeck_chart(deck)
 
         # Persistent Information Box for the selected species
         st.subheader("Information about selected observations:")
@@ -157,8 +270,10 @@ def display_map(species_selected, pin_color="red"):
         col1, col2 = st.columns(2)
         i = 0
 
+        by_name = group_by_species(species_data)
+
         for species in species_selected:
-            species_obs = [obs for obs in species_data if obs["comName"] == species]
+            species_obs = by_name.get(species, [])
             if i < len(species_selected)/2:
                 with col1:
                     st.markdown(f"### {species}")
@@ -175,14 +290,42 @@ def display_map(species_selected, pin_color="red"):
         st.error("No location data available for selected species.")
 
 
+# Map tab with its pin color picker; a fragment so map widgets only rerun this tab
+@st.fragment
+def display_map_tab(data_version, df_all, species_groups, species_selected):
+    # Use session state to manage the pin color
+    if "pin_color" not in st.session_state:
+        st.session_state.pin_color = "#FF0000"
+
+    pin_color = st.color_picker("Pick a color for map pins", st.session_state.pin_color)
+
+    # Update the map only if the color changes
+    if pin_color != st.session_state.pin_color:
+        st.session_state.pin_color = pin_color
+
+    display_map(data_version, df_all, species_groups, species_selected, st.session_state.pin_color)
+
+
 # Function to display recent notable observations in a region
+@st.fragment
 def display_notable_observations():
     region_code = st.text_input("Enter Region Code (e.g., US for United States)", "")
     if region_code:
-        notable_data = fetch_notable_observations(region_code)
+        try:
+            notable_data = fetch_notable_observations(region_code)
+        except EBirdError as exc:
+            st.error(str(exc))
+            return
         if notable_data:
             notable_df = pd.DataFrame(notable_data)
             if not notable_df.empty:
+                # Optionally narrow the cached results down to one species, matched on its eBird code
+                species_names = dict(zip(notable_df["speciesCode"], notable_df["comName"]))
+                species_options = ["All species"] + sorted(species_names, key=species_names.get)
+                notable_species = st.selectbox("Filter notable observations by species", species_options,
+                                               format_func=lambda code: species_names.get(code, code))
+                if notable_species != "All species":
+                    notable_df = notable_df[notable_df["speciesCode"] == notable_species]
                 st.dataframe(notable_df[['comName', 'locName', 'obsDt', 'howMany', 'lat', 'lng']])
             else:
                 st.info("No notable observations found for the selected region.")
@@ -192,108 +335,91 @@ def display_notable_observations():
         st.warning("Please enter a valid region code.")
 
 
-# Function to display line plot for multiple species
-def display_line_plot(species_selected):
-    species_dict = observed_US_cached()
-    species_data = [obs for obs in species_dict if obs["comName"] in species_selected]
-
-    if not species_data:
-        st.error(f"No data available for species: {', '.join(species_selected)}")
-        return
+# Line plot figure for a species selection; cache_data hands each rerun its own copy
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def line_plot_figure(species_tuple, data_version, _df_all, _species_groups):
+    species_selected = list(species_tuple)
+    species_data = species_frame(tuple(sorted(species_selected)), data_version, _df_all, _species_groups)
 
-    combined_data = []
-    for species in species_selected:
-        species_data_filtered = [obs for obs in species_data if obs["comName"] == species]
-        for obs in species_data_filtered:
-            combined_data.append({
-                "species": species,
-                "date": pd.to_datetime(obs["obsDt"]),
-                "population": obs.get("howMany", 0)
-            })
-
-    df = pd.DataFrame(combined_data)
+    # Build the plot frame straight from the selected columns
+    df = pd.DataFrame({
+        "species": species_data["comName"],
+        "date": species_data["obsDt"],
+        # Uncounted sightings are drawn as 0
+        "population": species_data["howMany"].fillna(0).astype("int32")
+    })
     df.sort_values(by="date", inplace=True)
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-
-    for species in species_selected:
-        species_data_filtered = df[df["species"] == species]
-        ax.plot(species_data_filtered["date"], species_data_filtered["population"], marker='o', label=species)
-
-    ax.set_title(f"Population over observation date")
-    ax.set_xlabel('Date')
-    ax.set_ylabel('Population')
-    ax.legend()
-
-    plt.xticks(rotation=45, ha="right")
-    st.pyplot(fig)
+    fig = px.line(df, x="date", y="population", color="species", markers=True,
+                  category_orders={"species": species_selected},
+                  title="Population over observation date",
+                  labels={"date": "Date", "population": "Population", "species": "Species"})
+    fig.update_xaxes(tickangle=-45)
+    return fig
 
 
-# Function to display bar graph for multiple species grouped by date
-def display_bar_graph(species_selected):
-    species_dict = observed_US_cached()
-    species_data = [obs for obs in species_dict if obs["comName"] in species_selected]
+# Function to display line plot for multiple species
+def display_line_plot(data_version, df_all, species_groups, species_selected):
+    species_data = species_frame(tuple(sorted(species_selected)), data_version, df_all, species_groups)
 
-    if not species_data:
+    if species_data.empty:
         st.error(f"No data available for species: {', '.join(species_selected)}")
         return
 
-    all_dates = []
-    all_populations = []
-    all_species = []
-
-    for species in species_selected:
-        species_data_filtered = [obs for obs in species_data if obs["comName"] == species]
-        for obs in species_data_filtered:
-            all_dates.append(obs["obsDt"])
-            all_populations.append(obs.get("howMany", 0))
-            all_species.append(species)
+    st.plotly_chart(line_plot_figure(tuple(species_selected), data_version, df_all, species_groups))
 
-    all_dates = pd.to_datetime(all_dates)
 
-    df = pd.DataFrame({
-        "date": all_dates,
-        "population": all_populations,
-        "species": all_species
-    })
+# Bar graph figure for a species selection; cache_data hands each rerun its own copy
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def bar_graph_figure(species_tuple, data_version, _df_all, _species_groups):
+    species_selected = list(species_tuple)
+    species_data = species_frame(tuple(sorted(species_selected)), data_version, _df_all, _species_groups)
 
-    grouped_df = df.groupby(["date", "species"]).sum().reset_index()
+    # Total the counts per calendar day and species in one pass over the categorical frame
+    grouped_df = (species_data.assign(obsDt=species_data["obsDt"].dt.normalize())
+                  .groupby(["obsDt", "comName"], as_index=False, observed=True, sort=False)["howMany"]
+                  .sum()
+                  .rename(columns={"obsDt": "date", "comName": "species", "howMany": "population"})
+                  .astype({"population": "int32"}))
 
     unique_species = species_selected
-    color_map = matplotlib.cm.get_cmap("tab20", len(unique_species))
+    # Sample one tab20 color per species up front
+    colors = matplotlib.colormaps["tab20"].resampled(len(unique_species))(range(len(unique_species)))
+
+    color_discrete_map = {species: matplotlib.colors.to_hex(colors[i])
+                          for i, species in enumerate(unique_species)}
 
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig = px.bar(grouped_df, x="date", y="population", color="species", barmode="group",
+                 category_orders={"species": unique_species},
+                 color_discrete_map=color_discrete_map,
+                 title="Population Observed for Selected Species Grouped by Date",
+                 labels={"date": "Observation Date", "population": "Total Population Observed",
+                         "species": "Species"})
+    fig.update_xaxes(tickangle=-45)
+    return fig
 
-    for i, species in enumerate(unique_species):
-        species_data = grouped_df[grouped_df["species"] == species]
-        for idx, row in species_data.iterrows():
-            label = species if idx == species_data.index[0] else ""
-            ax.bar(row["date"], row["population"], label=label, color=color_map(i / len(unique_species)))
 
-    ax.set_title("Population Observed for Selected Species Grouped by Date")
-    ax.set_xlabel("Observation Date")
-    ax.set_ylabel("Total Population Observed")
+# Function to display bar graph for multiple species grouped by date
+def display_bar_graph(data_version, df_all, species_groups, species_selected):
+    species_data = species_frame(tuple(sorted(species_selected)), data_version, df_all, species_groups)
 
-    plt.xticks(rotation=45, ha="right")
+    if species_data.empty:
+        st.error(f"No data available for species: {', '.join(species_selected)}")
+        return
 
-    ax.legend(title="Species")
-    st.pyplot(fig)
+    st.plotly_chart(bar_graph_figure(tuple(species_selected), data_version, df_all, species_groups))
 
 
 # Function to display interactive table for multiple species
-def display_table(species_selected):
-    species_dict = observed_US_cached()
-    species_data = [obs for obs in species_dict if obs["comName"] in species_selected]
+@st.fragment
+def display_table(data_version, df_all, species_groups, species_selected):
+    species_data = species_frame(tuple(sorted(species_selected)), data_version, df_all, species_groups)
 
-    if not species_data:
+    if species_data.empty:
         st.error(f"No data available for species: {', '.join(species_selected)}")
         return
 
-    df = pd.DataFrame(species_data)
-
-    if df.empty:
-        st.error("No data available to display.")
-        return
+    df = species_data
 
     # Let the user select data view mode
     selection_choice = st.radio(
@@ -308,47 +434,26 @@ def display_table(species_selected):
         )
         simplify_data = st.checkbox("Simplify data?")
 
-        # Filter DataFrame by selected species
-        filtered_df = df[df["comName"].isin(species_filter)] if species_filter else df
-
-        # Define column mappings
-        column_mapping = {
-            "speciesCode": "Species Code",
-            "comName": "Common Name",
-            "sciName": "Scientific Name",
-            "locID": "Location ID",
-            "locName": "Location Observed",
-            "obsDt": "Date Observed",
-            "howMany": "Population",
-            "lat": "Latitude",
-            "lng": "Longitude",
-            "valid": "Valid Observation",
-            "reviewed": "Reviewed Observation",
-            "private": "Location Private",
-            "subID": "Sub ID",
-        }
-
-        # Check for missing columns
-        existing_columns = [col for col in column_mapping.keys() if col in filtered_df.columns]
+        # Project to the displayed columns before filtering and renaming
+        source_columns = SIMPLIFIED_TABLE_COLUMNS if simplify_data else list(TABLE_COLUMN_MAPPING)
+        existing_columns = [col for col in source_columns if col in df.columns]
         if not existing_columns:
             st.error("No relevant data available to display.")
             return
+        filtered_df = df[existing_columns]
 
-        # Apply renaming
-        filtered_df = filtered_df.rename(columns={k: v for k, v in column_mapping.items() if k in existing_columns})
+        # Filter DataFrame by selected species
+        if species_filter:
+            filtered_df = filtered_df[df["comName"].isin(species_filter)]
 
-        # Simplify or display full data
-        if simplify_data:
-            display_columns = ["Common Name", "Scientific Name", "Location Observed", "Population", "Latitude",
-                               "Longitude"]
-        else:
-            display_columns = [column_mapping[col] for col in existing_columns]
+        # Apply renaming
+        filtered_df = filtered_df.rename(columns=TABLE_COLUMN_MAPPING)
 
         # Display DataFrame
-        st.dataframe(filtered_df[display_columns])
+        display_dataframe(filtered_df, key="show_all_specific")
     elif selection_choice == "Raw Data":
         # Display raw data without filtering
-        st.dataframe(df)
+        display_dataframe(df, key="show_all_raw")
 
 
 ##################TO DO######################
@@ -410,10 +515,17 @@ if show_date:
 st.sidebar.info("You can select up to 11 species.")
 st.sidebar.warning("Unselecting all species will close displayed data.")
 
-# Set up species data
-species_dict = observed_US_cached()
-species_list = list({i["comName"] for i in species_dict})  # Remove duplicates
-species_list.sort()  # Optional: Sort for better UI experience
+# Refresh cached API data on demand
+if st.sidebar.button("Refresh data"):
+    st.cache_data.clear()
+    clear_disk_cache()
+
+# Set up species data; fetched up front so every tab renders from a warm cache
+try:
+    df_all, species_groups, species_list, data_version = observed_US_cached()
+except EBirdError as exc:
+    st.error(str(exc))
+    df_all, species_groups, species_list, data_version = pd.DataFrame(), {}, [], None
 
 # Sidebar species selection with a max selection limit
 species_selected = st.sidebar.multiselect(
@@ -429,38 +541,27 @@ if species_selected:
 else:
     st.info("Please select at least one species from the sidebar to view data.")
 
+# Renderer for each species tab, called with the data version, observation frame, its species index and the selection
+TAB_RENDERERS = {
+    "Map": display_map_tab,
+    "Line Plot": display_line_plot,
+    "Bar Graph": display_bar_graph,
+    "Interactive Table": display_table,
+}
+
 # Tabs for different visualizations
-tabs = st.tabs(["Map", "Line Plot", "Bar Graph", "Interactive Table", "Notable Observations"])
+tabs = st.tabs([*TAB_RENDERERS, "Notable Observations"])
 
 # Check the number of selected species
 if len(species_selected) > 11:
-    for i, tab_name in enumerate(["Map", "Line Plot", "Bar Graph", "Interactive Table"]):
-        with tabs[i]:
+    for tab in tabs[:len(TAB_RENDERERS)]:
+        with tab:
             st.error("You can only select up to 11 species. Please reduce your selection.")
-else:
-    for i, tab_name in enumerate(["Map", "Line Plot", "Bar Graph", "Interactive Table"]):
-        with tabs[i]:
-            if species_selected:
-                # Call the respective function based on the tab
-                if tab_name == "Map":
-                    # Use session state to manage the pin color
-                    if "pin_color" not in st.session_state:
-                        st.session_state.pin_color = "#FF0000"
-
-                    pin_color = st.color_picker("Pick a color for map pins", st.session_state.pin_color)
-
-                    # Update the map only if the color changes
-                    if pin_color != st.session_state.pin_color:
-                        st.session_state.pin_color = pin_color
-
-                    display_map(species_selected, st.session_state.pin_color)
-                elif tab_name == "Line Plot":
-                    display_line_plot(species_selected)
-                elif tab_name == "Bar Graph":
-                    display_bar_graph(species_selected)
-                elif tab_name == "Interactive Table":
-                    display_table(species_selected)
+elif species_selected:
+    for tab, render in zip(tabs, TAB_RENDERERS.values()):
+        with tab:
+            render(data_version, df_all, species_groups, species_selected)
 
 # Notable Observations Tab (Always available)
-with tabs[4]:
+with tabs[-1]:
     display_notable_observations()